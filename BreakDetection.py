@@ -1,15 +1,54 @@
 import xml.etree.ElementTree as ET
+import functools
 import math
-from datetime import datetime, timedelta
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+try:
+    from lxml import etree
+except ImportError:
+    # lxml is optional: without it GPX files are parsed with ElementTree
+    etree = None
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it the kernels run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+try:
+    from _detect import detect_pauses_core as _detect_pauses_core_compiled
+except ImportError:
+    # The Cython kernel is optional: without it the Numba/Python kernel is used
+    _detect_pauses_core_compiled = None
+
+# Earth's radius in meters
+EARTH_RADIUS = 6371000.0
+
+# GPX namespace and the qualified tags read from it, resolved once
+NS = '{http://www.topografix.com/GPX/1/1}'
+TRKPT = NS + 'trkpt'
+TIME = NS + 'time'
+
+# Errors raised when a GPX file is not valid XML
+GPX_PARSE_ERRORS = (ET.ParseError,) if etree is None else (ET.ParseError, etree.XMLSyntaxError)
+
+# UTC offset recorded for timestamps written without one (not a valid offset in seconds)
+NO_UTC_OFFSET = np.iinfo(np.int32).min
+
+# Relative margin under which bounding-box distance bounds are not trusted
+BOUND_TOLERANCE = 1e-3
 
 def haversine(lat1, lon1, lat2, lon2):
     """
     Calculate the distance between two geographic points using the Haversine formula.
     Returns the distance in meters.
     """
-    # Earth's radius in meters
-    R = 6371000.0
-    
     # Convert degrees to radians
     lat1_rad = math.radians(lat1)
     lon1_rad = math.radians(lon1)
@@ -20,73 +59,235 @@ def haversine(lat1, lon1, lat2, lon2):
     dlat = lat2_rad - lat1_rad
     dlon = lon2_rad - lon1_rad
     
-    # Haversine formula
+    # Haversine formula (a is clamped against rounding above 1 for antipodal points)
     a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    c = 2 * math.asin(math.sqrt(min(a, 1.0)))
     
-    distance = R * c
+    distance = EARTH_RADIUS * c
     return distance
 
-def extract_gpx_points(gpx_file):
+def haversine_np(lat1, lon1, lat2, lon2):
     """
-    Extract all points (latitude, longitude, timestamp) from a GPX file.
+    Vectorized Haversine formula operating on NumPy arrays.
+    Coordinates must already be converted to radians.
+    Returns the distances in meters.
     """
-    tree = ET.parse(gpx_file)
-    root = tree.getroot()
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
     
-    # Handle GPX namespaces
-    namespace = {'gpx': 'http://www.topografix.com/GPX/1/1'}
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    c = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
     
-    points = []
+    return EARTH_RADIUS * c
+
+def equirect_np(lat1, lon1, lat2, lon2):
+    """
+    Vectorized equirectangular approximation of the distance between points.
+    Accurate for short distances such as consecutive GPS points, at the cost
+    of a single cosine per pair. Coordinates must already be converted to radians.
+    Returns the distances in meters.
+    """
+    cos_lat_mid = np.cos(0.5 * (lat1 + lat2))
+    # Wrap the longitude difference into [-pi, pi] for points across the antimeridian
+    dlon = (lon2 - lon1 + np.pi) % (2 * np.pi) - np.pi
+    return EARTH_RADIUS * np.hypot(lat2 - lat1, cos_lat_mid * dlon)
+
+def calculate_segment_distances(lats_rad, lons_rad):
+    """
+    Calculate the distance of each segment between consecutive points.
+    Coordinates are expected in radians.
+    Returns (seg_dist, cum_dist) in meters, where seg_dist[i] is the distance
+    between points i and i+1 and cum_dist[i] the distance from the first point.
+    """
+    # Consecutive points are close enough for the equirectangular approximation
+    seg_dist = equirect_np(lats_rad[:-1], lons_rad[:-1], lats_rad[1:], lons_rad[1:])
     
-    # Extract trackpoints with timestamps
-    for trkpt in root.findall('.//gpx:trkpt', namespace):
-        lat = float(trkpt.get('lat'))
-        lon = float(trkpt.get('lon'))
+    # Running sum written in place after the leading zero, without a concatenated copy
+    cum_dist = np.empty(len(seg_dist) + 1)
+    cum_dist[0] = 0.0
+    np.cumsum(seg_dist, out=cum_dist[1:])
+    
+    return seg_dist, cum_dist
+
+@dataclass(frozen=True, eq=False)
+class GpxTrack:
+    """
+    Points of a GPX track stored as parallel arrays, with their distances.
+    Coordinates are in degrees (lats, lons) and radians (lats_rad, lons_rad),
+    timestamps in milliseconds since epoch with the UTC offset they were
+    written with in seconds, segment durations in seconds and distances in meters.
+    """
+    lats: np.ndarray
+    lons: np.ndarray
+    ts: np.ndarray
+    lats_rad: np.ndarray
+    lons_rad: np.ndarray
+    seg_dist: np.ndarray
+    seg_time: np.ndarray
+    cum_dist: np.ndarray
+    utc_offsets: np.ndarray
+
+def _parse_time_ms(text):
+    """
+    Parse a GPX timestamp into milliseconds since epoch (UTC), along with
+    its UTC offset in seconds (NO_UTC_OFFSET for a timestamp without one,
+    which is read as UTC).
+    Returns None if the timestamp cannot be parsed.
+    """
+    try:
+        if text.endswith('Z'):
+            # UTC timestamps are parsed in C by NumPy, which reads an empty or 'NaT' text as NaT
+            timestamp = np.datetime64(text[:-1], 'ms')
+            if np.isnat(timestamp):
+                return None
+            return int(timestamp.astype(np.int64)), 0
         
+        timestamp = datetime.fromisoformat(text)
+        if timestamp.tzinfo is None:
+            return round(timestamp.replace(tzinfo=timezone.utc).timestamp() * 1000), NO_UTC_OFFSET
+        return round(timestamp.timestamp() * 1000), int(timestamp.utcoffset().total_seconds())
+    except ValueError:
+        return None
+
+def _to_datetime(timestamp, utc_offset):
+    """
+    Convert a timestamp in milliseconds since epoch back to a datetime for display,
+    in the UTC offset it was written with (naive if it had none).
+    """
+    utc_time = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(milliseconds=int(timestamp))
+    
+    if utc_offset == NO_UTC_OFFSET:
+        return utc_time.replace(tzinfo=None)
+    return utc_time.astimezone(timezone(timedelta(seconds=int(utc_offset))))
+
+def _iter_trackpoints(gpx_file):
+    """
+    Yield the trackpoint elements of a GPX file, streaming them with lxml when available.
+    """
+    if etree is None:
+        tree = ET.parse(gpx_file)
+        root = tree.getroot()
+        yield from root.iter(TRKPT)
+        return
+    
+    with open(gpx_file, 'rb') as f:
+        for _, trkpt in etree.iterparse(f, tag=TRKPT):
+            yield trkpt
+            # Free the element once read and detach the trackpoints before it
+            # from their segment, to keep memory flat on large files
+            trkpt.clear()
+            while trkpt.getprevious() is not None:
+                del trkpt.getparent()[0]
+
+def extract_gpx_points(gpx_file):
+    """
+    Extract all points from a GPX file as parallel arrays.
+    Returns (lats, lons, ts, utc_offsets): latitudes and longitudes in degrees,
+    timestamps in milliseconds since epoch and their UTC offsets in seconds.
+    """
+    # Preallocated buffers, doubled whenever they are full
+    capacity = 1024
+    lats = np.empty(capacity)
+    lons = np.empty(capacity)
+    ts = np.empty(capacity, dtype=np.int64)
+    utc_offsets = np.empty(capacity, dtype=np.int32)
+    nb_points = 0
+    
+    # Extract trackpoints with timestamps
+    for trkpt in _iter_trackpoints(gpx_file):
         # Extract timestamp if available
-        time_elem = trkpt.find('gpx:time', namespace)
-        timestamp = None
-        if time_elem is not None and time_elem.text:
-            try:
-                timestamp = datetime.fromisoformat(time_elem.text.replace('Z', '+00:00'))
-            except:
-                timestamp = None
+        time_elem = trkpt.find(TIME)
+        if time_elem is None or not time_elem.text:
+            continue
         
-        if timestamp:  # Only keep points with timestamps
-            points.append((lat, lon, timestamp))
+        parsed = _parse_time_ms(time_elem.text.strip())
+        if parsed is None:  # Only keep points with timestamps
+            continue
+        
+        if nb_points == capacity:
+            capacity *= 2
+            lats = np.resize(lats, capacity)
+            lons = np.resize(lons, capacity)
+            ts = np.resize(ts, capacity)
+            utc_offsets = np.resize(utc_offsets, capacity)
+        
+        lats[nb_points] = float(trkpt.attrib['lat'])
+        lons[nb_points] = float(trkpt.attrib['lon'])
+        ts[nb_points], utc_offsets[nb_points] = parsed
+        nb_points += 1
     
-    return points
+    return lats[:nb_points], lons[:nb_points], ts[:nb_points], utc_offsets[:nb_points]
 
-def calculate_max_distance_window(points, start_index, duration_seconds):
+@functools.lru_cache(maxsize=8)
+def _load_gpx_track_cached(gpx_file, mtime):
     """
-    Calculate the maximum distance between any two points within a time window
-    starting from a given index.
-    Returns the maximum distance in meters.
+    Build a GpxTrack from a GPX file. The modification time is only part of
+    the cache key so that an edited file is loaded again.
     """
-    start_point = points[start_index]
-    start_time = start_point[2]
-    end_time = start_time + timedelta(seconds=duration_seconds)
+    lats, lons, ts, utc_offsets = extract_gpx_points(gpx_file)
     
-    # Get all points within the time window
-    window_points = [start_point]
-    for i in range(start_index + 1, len(points)):
-        if points[i][2] <= end_time:
-            window_points.append(points[i])
-        else:
-            break
+    # Convert coordinates to radians once for all distance calculations
+    lats_rad = np.radians(lats)
+    lons_rad = np.radians(lons)
+    
+    # Pre-calculate segment and cumulative distances once
+    seg_dist, cum_dist = calculate_segment_distances(lats_rad, lons_rad)
+    seg_time = np.diff(ts) / 1000
     
-    # Calculate maximum distance between any two points in the window
-    max_distance = 0
-    for i, (lat1, lon1, _) in enumerate(window_points):
-        for lat2, lon2, _ in window_points[i+1:]:
-            distance = haversine(lat1, lon1, lat2, lon2)
-            if distance > max_distance:
-                max_distance = distance
+    # The same track is returned to every caller: make its arrays read-only
+    arrays = (lats, lons, ts, lats_rad, lons_rad, seg_dist, seg_time, cum_dist, utc_offsets)
+    for array in arrays:
+        array.flags.writeable = False
+    
+    return GpxTrack(*arrays)
+
+def load_gpx_track(gpx_file):
+    """
+    Load a GPX file as a GpxTrack, or return gpx_file unchanged if it already is one.
+    Tracks are cached per path and modification time, so a file is only parsed once.
+    """
+    if isinstance(gpx_file, GpxTrack):
+        return gpx_file
     
-    return max_distance
+    return _load_gpx_track_cached(gpx_file, os.path.getmtime(gpx_file))
 
-def calculate_average_pace_last_points(points, index, nb_points=10):
+def calculate_max_distance_window(lats_rad, lons_rad, ts, start_index, duration_seconds):
+    """
+    Calculate the maximum distance between any two points within a time window
+    starting from a given index. Coordinates are expected in radians and
+    timestamps in milliseconds.
+    Returns the maximum distance in meters.
+    """
+    # Find the end of the time window (timestamps are sorted)
+    end_time = ts[start_index] + round(duration_seconds * 1000)
+    end_index = max(np.searchsorted(ts, end_time, side='right'), start_index + 1)
+    
+    window_lats = lats_rad[start_index:end_index]
+    window_lons = lons_rad[start_index:end_index]
+    
+    # Calculate maximum distance between any two points in the window,
+    # broadcasting the window against itself into a distance matrix
+    distances = haversine_np(window_lats[:, None], window_lons[:, None],
+                             window_lats[None, :], window_lons[None, :])
+    return distances.max()
+
+@njit(cache=True)
+def _haversine_tables(lats, lons):
+    """
+    Precompute the per-point terms of the Haversine formula, so that distances
+    between points need no trigonometry besides the final asin.
+    Coordinates are expected in radians.
+    Returns an (n, 5) array of sin(lat/2), cos(lat/2), sin(lon/2), cos(lon/2), cos(lat).
+    """
+    tables = np.empty((len(lats), 5))
+    tables[:, 0] = np.sin(lats / 2)
+    tables[:, 1] = np.cos(lats / 2)
+    tables[:, 2] = np.sin(lons / 2)
+    tables[:, 3] = np.cos(lons / 2)
+    tables[:, 4] = np.cos(lats)
+    return tables
+
+def calculate_average_pace_last_points(cum_dist, ts, index, nb_points=10):
     """
     Calculate the average pace over the last N points before the given index.
     Returns pace in min/km. Returns None if not enough data.
@@ -101,15 +302,8 @@ def calculate_average_pace_last_points(points, index, nb_points=10):
         return None
     
     # Calculate total distance and time
-    total_distance = 0
-    total_time = 0
-    
-    for i in range(start_index, index):
-        lat1, lon1, ts1 = points[i]
-        lat2, lon2, ts2 = points[i + 1]
-        
-        total_distance += haversine(lat1, lon1, lat2, lon2)
-        total_time += (ts2 - ts1).total_seconds()
+    total_distance = cum_dist[index] - cum_dist[start_index]
+    total_time = (ts[index] - ts[start_index]) / 1000
     
     if total_distance == 0 or total_time == 0:
         return None
@@ -118,7 +312,7 @@ def calculate_average_pace_last_points(points, index, nb_points=10):
     pace = (total_time / total_distance) * 1000 / 60
     return pace
 
-def calculate_point_density_last_seconds(points, index, duration_seconds=30):
+def calculate_point_density_last_seconds(ts, index, duration_seconds=30):
     """
     Calculate point density (points per second) over the last N seconds before the given index.
     Returns points per second. Returns None if not enough data.
@@ -126,22 +320,15 @@ def calculate_point_density_last_seconds(points, index, duration_seconds=30):
     if index == 0:
         return None
     
-    current_time = points[index][2]
-    start_time = current_time - timedelta(seconds=duration_seconds)
-    
-    # Count points in the time window
-    nb_window_points = 0
-    for i in range(index, -1, -1):
-        if points[i][2] >= start_time:
-            nb_window_points += 1
-        else:
-            break
+    # First point of the time window (timestamps are sorted)
+    window_start = np.searchsorted(ts, ts[index] - round(duration_seconds * 1000), side='left')
+    nb_window_points = index - window_start + 1
     
     if nb_window_points < 2:
         return None
     
     # Calculate actual time span
-    actual_time = (points[index][2] - points[index - nb_window_points + 1][2]).total_seconds()
+    actual_time = (ts[index] - ts[window_start]) / 1000
     
     if actual_time == 0:
         return None
@@ -150,12 +337,258 @@ def calculate_point_density_last_seconds(points, index, duration_seconds=30):
     density = nb_window_points / actual_time
     return density
 
+@njit(cache=True)
+def _detect_pauses_core(lats, lons, ts, cum_dist, threshold_start, threshold_end, time_window_ms,
+                        time_window_end_ms, pace_threshold, nb_points_pace, density_threshold,
+                        density_window_ms, pace_threshold_end, nb_points_pace_end, check_stride_ms):
+    """
+    Run the pause detection state machine over the track in a single pass.
+    Coordinates are expected in radians, timestamps and time windows in milliseconds.
+    Every window is followed with pointers that only move forward, so the
+    criteria at each point are updated from the previous check instead of
+    being recomputed. Criteria are checked at most once every check_stride_ms.
+    Returns (starts, ends) index arrays, one entry per pause. An end of -1
+    means the track ends during the pause.
+    """
+    total_points = len(ts)
+    tables = _haversine_tables(lats, lons)
+    
+    # Distance windows, row 0 to start a pause and row 1 to end it: the index
+    # just past the last point pushed, and monotonic deques of the indices of
+    # the lat min, lat max, lon min and lon max of the window bounding box
+    window_ms = np.array([time_window_ms, time_window_end_ms])
+    window_ends = np.zeros(2, dtype=np.int64)
+    queues = np.empty((2, 4, total_points), dtype=np.int64)
+    heads = np.zeros((2, 4), dtype=np.int64)
+    tails = np.zeros((2, 4), dtype=np.int64)
+    
+    # First point of the density window
+    density_start = 0
+    
+    starts = np.empty(total_points, dtype=np.int64)
+    ends = np.empty(total_points, dtype=np.int64)
+    nb_pauses = 0
+    in_pause = False
+    
+    next_check = 0
+    while next_check < total_points:
+        i = next_check
+        
+        # Skip ahead to the first point at least check_stride_ms later
+        next_check = max(i + 1, np.searchsorted(ts, ts[i] + check_stride_ms, side='left'))
+        
+        if not in_pause:
+            # Three criteria to start pause, cheapest first:
+            # 1. Average pace is slower than threshold (or not enough data)
+            pace_start = max(i - nb_points_pace, 0)
+            total_distance = cum_dist[i] - cum_dist[pace_start]
+            total_time = (ts[i] - ts[pace_start]) / 1000
+            if total_distance != 0 and total_time != 0:
+                if not (total_time / total_distance) * 1000 / 60 > pace_threshold:
+                    continue
+            
+            # 2. Point density is below threshold (or not enough data)
+            while density_start < i and ts[density_start] < ts[i] - density_window_ms:
+                density_start += 1
+            actual_time = (ts[i] - ts[density_start]) / 1000
+            if actual_time != 0:
+                if not (i - density_start + 1) / actual_time < density_threshold:
+                    continue
+            
+            window = 0
+            threshold = threshold_start
+        
+        else:
+            # Two criteria must BOTH be met to end the pause:
+            # 1. Average pace is faster than threshold (excluding no data)
+            pace_start = max(i - nb_points_pace_end, 0)
+            total_distance = cum_dist[i] - cum_dist[pace_start]
+            total_time = (ts[i] - ts[pace_start]) / 1000
+            if total_distance == 0 or total_time == 0:
+                continue
+            if not (total_time / total_distance) * 1000 / 60 < pace_threshold_end:
+                continue
+            
+            window = 1
+            threshold = threshold_end
+        
+        # Last criterion of both states: max distance over the time window.
+        # Points skipped since the last update of this window are dropped at once
+        if window_ends[window] < i:
+            window_ends[window] = i
+            heads[window, :] = 0
+            tails[window, :] = 0
+        
+        # Push the points entering the window (a window always contains its starting point)
+        window_end = max(window_ends[window], i + 1)
+        while window_end < total_points and ts[window_end] <= ts[i] + window_ms[window]:
+            window_end += 1
+        for j in range(window_ends[window], window_end):
+            for k in range(4):
+                values = lats if k < 2 else lons
+                # Even rows keep the minimum, odd rows the maximum
+                sign = 1.0 if k % 2 == 0 else -1.0
+                while (tails[window, k] > heads[window, k]
+                       and sign * values[queues[window, k, tails[window, k] - 1]] >= sign * values[j]):
+                    tails[window, k] -= 1
+                queues[window, k, tails[window, k]] = j
+                tails[window, k] += 1
+        window_ends[window] = window_end
+        
+        # Drop points that are before the start of the window
+        for k in range(4):
+            while queues[window, k, heads[window, k]] < i:
+                heads[window, k] += 1
+        
+        # Bound the max distance with the bounding box of the window (equirectangular,
+        # exact enough at window scale): the longest side and the diagonal
+        lat_min = lats[queues[window, 0, heads[window, 0]]]
+        lat_max = lats[queues[window, 1, heads[window, 1]]]
+        lon_min = lons[queues[window, 2, heads[window, 2]]]
+        lon_max = lons[queues[window, 3, heads[window, 3]]]
+        height = (lat_max - lat_min) * EARTH_RADIUS
+        width = (lon_max - lon_min) * EARTH_RADIUS * math.cos((lat_min + lat_max) / 2)
+        lower = max(height, width)
+        upper = math.hypot(height, width)
+        
+        # The box of a window across the antimeridian spans the whole globe: no bounds then
+        bounded = lon_max - lon_min <= math.pi
+        
+        # The exact pairwise distance is only needed when the bounds are too
+        # close to the threshold, and only up to the first pair above it
+        if bounded and upper < threshold * (1 - BOUND_TOLERANCE):
+            max_distance = upper
+        elif bounded and lower > threshold * (1 + BOUND_TOLERANCE):
+            max_distance = lower
+        else:
+            max_distance = 0.0
+            p = i
+            while p < window_end and max_distance <= threshold:
+                for q in range(p + 1, window_end):
+                    # Half-angle differences are expanded as sin(a - b) = sin(a)cos(b) - cos(a)sin(b),
+                    # which stays accurate for nearby points unlike the 1 - cos(a - b) form
+                    sin_half_dlat = tables[q, 0] * tables[p, 1] - tables[q, 1] * tables[p, 0]
+                    sin_half_dlon = tables[q, 2] * tables[p, 3] - tables[q, 3] * tables[p, 2]
+                    h = sin_half_dlat**2 + tables[p, 4] * tables[q, 4] * sin_half_dlon**2
+                    distance = 2 * EARTH_RADIUS * math.asin(math.sqrt(min(h, 1.0)))
+                    if distance > max_distance:
+                        max_distance = distance
+                        if distance > threshold:
+                            break
+                p += 1
+        
+        if not in_pause:
+            if max_distance < threshold_start:
+                in_pause = True
+                starts[nb_pauses] = i
+                ends[nb_pauses] = -1
+        
+        elif max_distance > threshold_end:
+            in_pause = False
+            ends[nb_pauses] = i
+            nb_pauses += 1
+    
+    # Keep the pause the track ends in
+    if in_pause:
+        nb_pauses += 1
+    
+    return starts[:nb_pauses], ends[:nb_pauses]
+
+def _close_pause(track, start_index, end_index, ended_with_track):
+    """
+    Build the description of a pause between two point indices of a track.
+    Distances and times are read from the cumulative arrays in O(1).
+    """
+    lats, lons, ts, cum_dist = track.lats, track.lons, track.ts, track.cum_dist
+    
+    return {
+        'start': _to_datetime(ts[start_index], track.utc_offsets[start_index]),
+        'end': _to_datetime(ts[end_index], track.utc_offsets[end_index]),
+        'duration_seconds': (ts[end_index] - ts[start_index]) / 1000,
+        'time_from_start_seconds': (ts[start_index] - ts[0]) / 1000,
+        'start_coords': (lats[start_index], lons[start_index]),
+        'end_coords': (lats[end_index], lons[end_index]),
+        'distance_meters': cum_dist[end_index] - cum_dist[start_index],
+        'start_index': start_index,
+        'end_index': end_index,
+        'distance_start_km': cum_dist[start_index] / 1000,
+        'distance_end_km': cum_dist[end_index] / 1000,
+        'nb_points': end_index - start_index + 1,
+        'ended_with_track': ended_with_track
+    }
+
+def _report(track, pauses, threshold_start, threshold_end, time_window, pace_threshold,
+            nb_points_pace, density_threshold, density_window, time_window_end,
+            pace_threshold_end, nb_points_pace_end):
+    """
+    Print the detection criteria and the start/end of each detected pause.
+    The report is built once after detection and printed in a single call.
+    """
+    lats_rad, lons_rad, ts, cum_dist = track.lats_rad, track.lons_rad, track.ts, track.cum_dist
+    
+    lines = [
+        f"Analyzing {len(ts)} points for breaks...",
+        f"Break starts when:",
+        f"  - Max distance over {time_window}s < {threshold_start}m",
+        f"  - Average pace over last {nb_points_pace} points > {pace_threshold} min/km (slower)",
+        f"  - Point density over last {density_window}s < {density_threshold} points/sec",
+        f"Break ends when BOTH:",
+        f"  - Max distance over {time_window_end}s > {threshold_end}m",
+        f"  - AND average pace over last {nb_points_pace_end} points < {pace_threshold_end} min/km (faster)",
+        "",
+    ]
+    
+    for pause in pauses:
+        start_index = pause['start_index']
+        end_index = pause['end_index']
+        start_distance = cum_dist[start_index]
+        end_distance = cum_dist[end_index]
+        duration = pause['duration_seconds']
+        
+        max_distance = calculate_max_distance_window(lats_rad, lons_rad, ts, start_index, time_window)
+        avg_pace = calculate_average_pace_last_points(cum_dist, ts, start_index, nb_points_pace)
+        point_density = calculate_point_density_last_seconds(ts, start_index, density_window)
+        
+        lines.append(f"⏸️  Break detected: {pause['start']}")
+        lines.append(f"   At distance: {start_distance:.2f}m ({start_distance/1000:.3f}km)")
+        lines.append(f"   Max distance over {time_window}s: {max_distance:.2f}m")
+        if avg_pace is not None:
+            lines.append(f"   Average pace: {avg_pace:.2f} min/km (slower than {pace_threshold} min/km)")
+        else:
+            lines.append(f"   Average pace: Not enough data (assumed slower than {pace_threshold} min/km)")
+        if point_density is not None:
+            lines.append(f"   Point density: {point_density:.3f} points/sec (lower than {density_threshold} points/sec)")
+        else:
+            lines.append(f"   Point density: Not enough data (assumed lower than {density_threshold} points/sec)")
+        
+        if pause['ended_with_track']:
+            lines.append(f"▶️  Break ended at end of track: {pause['end']}")
+            lines.append(f"   At distance: {end_distance:.2f}m ({end_distance/1000:.3f}km)")
+            lines.append(f"   Duration: {duration:.0f} seconds ({duration/60:.1f} minutes)")
+            lines.append(f"   Distance during break: {pause['distance_meters']:.2f}m")
+            lines.append("")
+            continue
+        
+        max_distance = calculate_max_distance_window(lats_rad, lons_rad, ts, end_index, time_window_end)
+        avg_pace = calculate_average_pace_last_points(cum_dist, ts, end_index, nb_points_pace_end)
+        
+        lines.append(f"▶️  Break ended: {pause['end']}")
+        lines.append(f"   At distance: {end_distance:.2f}m ({end_distance/1000:.3f}km)")
+        lines.append(f"   Duration: {duration:.0f} seconds ({duration/60:.1f} minutes)")
+        lines.append(f"   Distance during break: {pause['distance_meters']:.2f}m")
+        lines.append(f"   Max distance over {time_window_end}s: {max_distance:.2f}m (> {threshold_end}m)")
+        lines.append(f"   Average pace: {avg_pace:.2f} min/km (< {pace_threshold_end} min/km = running)")
+        lines.append("")
+    
+    print("\n".join(lines))
+
 def detect_pauses(gpx_file, threshold_start=30, threshold_end=30, time_window=45, 
                   pace_threshold=15, nb_points_pace=10, 
                   density_threshold=1.0, density_window=30, time_window_end=30,
-                  pace_threshold_end=20, nb_points_pace_end=7):
+                  pace_threshold_end=20, nb_points_pace_end=7, check_stride_seconds=0,
+                  verbose=True):
     """
-    Detect pauses in a GPX track.
+    Detect pauses in a GPX track, given as a file path or a GpxTrack.
     
     Parameters:
     - threshold_start: distance threshold in meters to start a pause (presently 30m)
@@ -168,233 +601,79 @@ def detect_pauses(gpx_file, threshold_start=30, threshold_end=30, time_window=45
     - time_window_end: time window in seconds to check distance for END of pause (presently 30s)
     - pace_threshold_end: minimum pace in min/km to end pause (presently 20 min/km - must be faster)
     - nb_points_pace_end: number of points to calculate average speed for END (presently 7)
+    - check_stride_seconds: minimum time between two checks of the criteria (presently 0s,
+      every point); a stride skips checks on dense tracks, but pause boundaries
+      can then move by up to one stride
+    - verbose: print the criteria and each detected pause once detection is done
     
     Pause ends when BOTH conditions are met:
     - distance increases above threshold_end over time_window_end
     - pace becomes faster than pace_threshold_end over nb_points_pace_end points
     
-    Returns a list of pauses with start time, end time, duration, and distance during pause.
+    Returns a list of pauses with start time, end time, duration, and distance during pause,
+    along with the GpxTrack.
     """
-    points = extract_gpx_points(gpx_file)
+    track = load_gpx_track(gpx_file)
+    ts = track.ts
+    total_points = len(ts)
     
-    if len(points) < 2:
+    if total_points < 2:
         print("Error: Not enough points with timestamps in the GPX file.")
-        return [], points
-    
-    print(f"Analyzing {len(points)} points for breaks...")
-    print(f"Break starts when:")
-    print(f"  - Max distance over {time_window}s < {threshold_start}m")
-    print(f"  - Average pace over last {nb_points_pace} points > {pace_threshold} min/km (slower)")
-    print(f"  - Point density over last {density_window}s < {density_threshold} points/sec")
-    print(f"Break ends when BOTH:")
-    print(f"  - Max distance over {time_window_end}s > {threshold_end}m")
-    print(f"  - AND average pace over last {nb_points_pace_end} points < {pace_threshold_end} min/km (faster)\n")
-    
-    # Store the start time of the activity (first point)
-    activity_start_time = points[0][2]
-    
-    # Pre-calculate cumulative distance at each point
-    cumulative_distances = [0]
-    for i in range(len(points) - 1):
-        lat1, lon1, _ = points[i]
-        lat2, lon2, _ = points[i+1]
-        cumulative_distances.append(cumulative_distances[-1] + haversine(lat1, lon1, lat2, lon2))
+        return [], track
     
-    pauses = []
-    in_pause = False
-    pause_start = None
-    pause_start_index = None
-    pause_start_distance = None
-    i = 0
+    # Prefer the Cython kernel when it has been built
+    detect_pauses_core = _detect_pauses_core_compiled or _detect_pauses_core
+    starts, ends = detect_pauses_core(track.lats_rad, track.lons_rad, ts, track.cum_dist,
+                                      threshold_start, threshold_end,
+                                      round(time_window * 1000), round(time_window_end * 1000),
+                                      pace_threshold, nb_points_pace, density_threshold,
+                                      round(density_window * 1000), pace_threshold_end,
+                                      nb_points_pace_end, round(check_stride_seconds * 1000))
     
-    while i < len(points):
-        current_point = points[i]
-        
-        if not in_pause:
-            # Check if we should start a pause
-            max_distance = calculate_max_distance_window(points, i, time_window)
-            avg_pace = calculate_average_pace_last_points(points, i, nb_points_pace)
-            point_density = calculate_point_density_last_seconds(points, i, density_window)
-            
-            # Three criteria to start pause:
-            # 1. Max distance over time window is below threshold
-            distance_criterion = max_distance < threshold_start
-            
-            # 2. Average pace is slower than threshold (or None if not enough data)
-            pace_criterion = (avg_pace is None) or (avg_pace > pace_threshold)
-            
-            # 3. Point density is below threshold (or None if not enough data)
-            density_criterion = (point_density is None) or (point_density < density_threshold)
-            
-            # We start pause when ALL THREE criteria are met
-            if distance_criterion and pace_criterion and density_criterion:
-                in_pause = True
-                pause_start = current_point
-                pause_start_index = i
-                pause_start_distance = cumulative_distances[i]
-                
-                print(f"⏸️  Break detected: {current_point[2]}")
-                print(f"   At distance: {pause_start_distance:.2f}m ({pause_start_distance/1000:.3f}km)")
-                print(f"   Max distance over {time_window}s: {max_distance:.2f}m")
-                if avg_pace is not None:
-                    print(f"   Average pace: {avg_pace:.2f} min/km (slower than {pace_threshold} min/km)")
-                else:
-                    print(f"   Average pace: Not enough data (assumed slower than {pace_threshold} min/km)")
-                if point_density is not None:
-                    print(f"   Point density: {point_density:.3f} points/sec (lower than {density_threshold} points/sec)")
-                else:
-                    print(f"   Point density: Not enough data (assumed lower than {density_threshold} points/sec)")
-        
+    pauses = []
+    for pause_start_index, pause_end_index in zip(starts, ends):
+        # Handle case where track ends during a pause
+        if pause_end_index < 0:
+            pauses.append(_close_pause(track, int(pause_start_index), total_points - 1, True))
         else:
-            # Check if we should end the pause - TWO criteria must BOTH be met
-            max_distance = calculate_max_distance_window(points, i, time_window_end)
-            avg_pace = calculate_average_pace_last_points(points, i, nb_points_pace_end)
-            
-            # Criterion 1: Max distance over time window exceeds threshold
-            distance_criterion = max_distance > threshold_end
-            
-            # Criterion 2: Average pace is faster than threshold (excluding None case)
-            pace_criterion = (avg_pace is not None) and (avg_pace < pace_threshold_end)
-            
-            # We end pause when BOTH criteria are met
-            if distance_criterion and pace_criterion:
-                pause_end = current_point
-                pause_end_index = i
-                pause_end_distance = cumulative_distances[i]
-                duration = (pause_end[2] - pause_start[2]).total_seconds()
-                
-                # Calculate distance traveled during pause
-                distance_during_pause = 0
-                for j in range(pause_start_index, pause_end_index):
-                    lat1, lon1, _ = points[j]
-                    lat2, lon2, _ = points[j+1]
-                    distance_during_pause += haversine(lat1, lon1, lat2, lon2)
-                
-                # Calculate time from start of activity
-                time_from_start = (pause_start[2] - activity_start_time).total_seconds()
-                
-                pause_info = {
-                    'start': pause_start[2],
-                    'end': pause_end[2],
-                    'duration_seconds': duration,
-                    'time_from_start_seconds': time_from_start,
-                    'start_coords': (pause_start[0], pause_start[1]),
-                    'end_coords': (pause_end[0], pause_end[1]),
-                    'distance_meters': distance_during_pause,
-                    'start_index': pause_start_index,
-                    'end_index': pause_end_index,
-                    'distance_start_km': pause_start_distance / 1000,
-                    'distance_end_km': pause_end_distance / 1000,
-                    'nb_points': pause_end_index - pause_start_index + 1
-                }
-                pauses.append(pause_info)
-                
-                print(f"▶️  Break ended: {pause_end[2]}")
-                print(f"   At distance: {pause_end_distance:.2f}m ({pause_end_distance/1000:.3f}km)")
-                print(f"   Duration: {duration:.0f} seconds ({duration/60:.1f} minutes)")
-                print(f"   Distance during break: {distance_during_pause:.2f}m")
-                print(f"   Max distance over {time_window_end}s: {max_distance:.2f}m (> {threshold_end}m)")
-                print(f"   Average pace: {avg_pace:.2f} min/km (< {pace_threshold_end} min/km = running)\n")
-                
-                in_pause = False
-                pause_start = None
-                pause_start_index = None
-                pause_start_distance = None
-        
-        i += 1
+            pauses.append(_close_pause(track, int(pause_start_index), int(pause_end_index), False))
     
-    # Handle case where track ends during a pause
-    if in_pause:
-        pause_end = points[-1]
-        pause_end_index = len(points) - 1
-        pause_end_distance = cumulative_distances[pause_end_index]
-        duration = (pause_end[2] - pause_start[2]).total_seconds()
-        
-        # Calculate distance traveled during pause
-        distance_during_pause = 0
-        for j in range(pause_start_index, pause_end_index):
-            lat1, lon1, _ = points[j]
-            lat2, lon2, _ = points[j+1]
-            distance_during_pause += haversine(lat1, lon1, lat2, lon2)
-        
-        # Calculate time from start of activity
-        time_from_start = (pause_start[2] - activity_start_time).total_seconds()
-        
-        pause_info = {
-            'start': pause_start[2],
-            'end': pause_end[2],
-            'duration_seconds': duration,
-            'time_from_start_seconds': time_from_start,
-            'start_coords': (pause_start[0], pause_start[1]),
-            'end_coords': (pause_end[0], pause_end[1]),
-            'distance_meters': distance_during_pause,
-            'start_index': pause_start_index,
-            'end_index': pause_end_index,
-            'distance_start_km': pause_start_distance / 1000,
-            'distance_end_km': pause_end_distance / 1000,
-            'nb_points': pause_end_index - pause_start_index + 1
-        }
-        pauses.append(pause_info)
-        
-        print(f"▶️  Break ended at end of track: {pause_end[2]}")
-        print(f"   At distance: {pause_end_distance:.2f}m ({pause_end_distance/1000:.3f}km)")
-        print(f"   Duration: {duration:.0f} seconds ({duration/60:.1f} minutes)")
-        print(f"   Distance during break: {distance_during_pause:.2f}m\n")
+    if verbose:
+        _report(track, pauses, threshold_start, threshold_end, time_window, pace_threshold,
+                nb_points_pace, density_threshold, density_window, time_window_end,
+                pace_threshold_end, nb_points_pace_end)
     
-    return pauses, points
+    return pauses, track
 
 def calculate_total_distance(gpx_file):
     """
-    Calculate the total distance of the GPS track.
+    Calculate the total distance of the GPS track, given as a file path or a GpxTrack.
     Returns distance in meters.
     """
-    points = extract_gpx_points(gpx_file)
+    track = load_gpx_track(gpx_file)
     
-    if len(points) < 2:
+    if len(track.ts) < 2:
         return 0
     
-    total_distance = 0
-    for i in range(len(points) - 1):
-        lat1, lon1, _ = points[i]
-        lat2, lon2, _ = points[i+1]
-        total_distance += haversine(lat1, lon1, lat2, lon2)
-    
-    return total_distance
+    return track.cum_dist[-1]
 
-def calculate_average_pace_during_pause(points, start_index, end_index):
+def calculate_average_pace_during_pause(seg_dist, seg_time, start_index, end_index):
     """
     Calculate the average pace during a pause from instantaneous speeds.
     Calculates speed for each segment, then averages them.
-    Returns pace in min/km format.
+    Returns pace in min/km format, or NaN if no segment can be used.
     """
-    if not points or start_index >= end_index:
-        return None
-    
-    # Calculate instantaneous pace for each segment
-    instantaneous_paces = []
+    distances = seg_dist[start_index:end_index]
+    durations = seg_time[start_index:end_index]
     
-    for i in range(start_index, end_index):
-        lat1, lon1, ts1 = points[i]
-        lat2, lon2, ts2 = points[i+1]
-        
-        # Calculate distance for this segment
-        distance_meters = haversine(lat1, lon1, lat2, lon2)
-        
-        # Calculate time for this segment
-        duration_seconds = (ts2 - ts1).total_seconds()
-        
-        # Avoid division by zero
-        if distance_meters > 0 and duration_seconds > 0:
-            # Calculate instantaneous pace (min/km) for this segment
-            pace_segment = (duration_seconds / distance_meters) * 1000 / 60
-            instantaneous_paces.append(pace_segment)
-    
-    # Return the average of all instantaneous paces
-    if len(instantaneous_paces) == 0:
-        return None
+    # Avoid division by zero
+    valid = (distances > 0) & (durations > 0)
+    if not valid.any():
+        return np.nan
     
-    average_pace = sum(instantaneous_paces) / len(instantaneous_paces)
-    return average_pace
+    # Average the instantaneous pace (min/km) of each segment
+    paces = (durations[valid] / distances[valid]) * 1000 / 60
+    return float(paces.mean())
 
 def format_pace(pace_min_per_km):
     """
@@ -425,8 +704,8 @@ if __name__ == "__main__":
         # Calculate total GPS distance
         total_gps_distance = calculate_total_distance(gpx_file)
         
-        # Detect pauses and get points
-        pauses, points = detect_pauses(
+        # Detect pauses and get the track (loaded once and shared through the cache)
+        pauses, track = detect_pauses(
             gpx_file, 
             threshold_start=30,        # Distance threshold to START pause: < 30m over 45s
             threshold_end=30,          # Distance threshold to END pause: > 30m over 30s
@@ -467,8 +746,8 @@ if __name__ == "__main__":
                     print(f"  Point density: 1 point every {point_density:.2f} seconds ({nb_points} points total)")
                 
                 # Calculate and display average pace during pause from GPX data
-                avg_pace = calculate_average_pace_during_pause(points, pause['start_index'], pause['end_index'])
-                if avg_pace:
+                avg_pace = calculate_average_pace_during_pause(track.seg_dist, track.seg_time, pause['start_index'], pause['end_index'])
+                if not math.isnan(avg_pace):
                     print(f"  Average pace during break (from GPX): {format_pace(avg_pace)} min/km")
                 
                 print()
@@ -493,7 +772,7 @@ if __name__ == "__main__":
     
     except FileNotFoundError:
         print(f"Error: File '{gpx_file}' not found.")
-    except ET.ParseError:
+    except GPX_PARSE_ERRORS:
         print(f"Error: File '{gpx_file}' is not a valid GPX file.")
     except Exception as e:
         print(f"Unexpected error: {e}")
\ No newline at end of file
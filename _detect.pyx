@@ -0,0 +1,227 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# distutils: extra_compile_args = -O3 -ffast-math -march=native
+# distutils: libraries = m
+"""
+Compiled version of the pause detection kernel of BreakDetection.py.
+
+Build it in place next to BreakDetection.py with:
+    cythonize -i _detect.pyx
+
+When the extension is available, detect_pauses uses detect_pauses_core from
+this module instead of the Numba/Python kernel. Both implementations must
+give the same pauses. NaN is never used to mark missing data: -ffast-math
+assumes finite values.
+"""
+import numpy as np
+
+from libc.math cimport M_PI, asin, cos, sin, sqrt
+from libc.stdint cimport int64_t
+
+# Same values as in BreakDetection.py
+cdef double EARTH_RADIUS = 6371000.0
+cdef double BOUND_TOLERANCE = 1e-3
+
+
+cdef void _haversine_tables(const double[::1] lats, const double[::1] lons, double[:, ::1] tables) nogil:
+    """
+    Precompute sin(lat/2), cos(lat/2), sin(lon/2), cos(lon/2) and cos(lat) for each point.
+    """
+    cdef Py_ssize_t i
+    for i in range(lats.shape[0]):
+        tables[i, 0] = sin(lats[i] / 2)
+        tables[i, 1] = cos(lats[i] / 2)
+        tables[i, 2] = sin(lons[i] / 2)
+        tables[i, 3] = cos(lons[i] / 2)
+        tables[i, 4] = cos(lats[i])
+
+
+cdef inline Py_ssize_t _search_left(const int64_t[::1] ts, int64_t value,
+                                    Py_ssize_t low, Py_ssize_t high) nogil:
+    """
+    Binary search for the first index in [low, high) whose timestamp is not
+    before value (timestamps are sorted). Returns high if there is none.
+    """
+    cdef Py_ssize_t middle
+
+    while low < high:
+        middle = (low + high) // 2
+        if ts[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+
+    return low
+
+
+def detect_pauses_core(const double[::1] lats, const double[::1] lons, const int64_t[::1] ts,
+                       const double[::1] cum_dist, double threshold_start, double threshold_end,
+                       int64_t time_window_ms, int64_t time_window_end_ms, double pace_threshold,
+                       Py_ssize_t nb_points_pace, double density_threshold, int64_t density_window_ms,
+                       double pace_threshold_end, Py_ssize_t nb_points_pace_end,
+                       int64_t check_stride_ms):
+    """
+    Run the pause detection state machine over the track in a single pass.
+    Coordinates are expected in radians, timestamps and time windows in milliseconds.
+    Every window is followed with pointers that only move forward.
+    Criteria are checked at most once every check_stride_ms.
+    Returns (starts, ends) index arrays, one entry per pause. An end of -1
+    means the track ends during the pause.
+    """
+    cdef Py_ssize_t total_points = ts.shape[0]
+    cdef Py_ssize_t i, j, k, p, q, next_check = 0, nb_pauses = 0
+    cdef Py_ssize_t pace_start, density_start = 0, window, window_end
+    cdef bint in_pause = False, bounded
+    cdef double total_distance, total_time, actual_time, threshold, sign
+    cdef double lat_min, lat_max, lon_min, lon_max, height, width, lower, upper
+    cdef double max_distance, distance, sin_half_dlat, sin_half_dlon, h
+    cdef const double* values
+
+    # Distance windows, row 0 to start a pause and row 1 to end it: the index
+    # just past the last point pushed, and monotonic deques of the indices of
+    # the lat min, lat max, lon min and lon max of the window bounding box
+    cdef int64_t window_ms[2]
+    cdef Py_ssize_t window_ends[2]
+    cdef Py_ssize_t heads[2][4]
+    cdef Py_ssize_t tails[2][4]
+    window_ms[0] = time_window_ms
+    window_ms[1] = time_window_end_ms
+    window_ends[0] = window_ends[1] = 0
+    for window in range(2):
+        for k in range(4):
+            heads[window][k] = tails[window][k] = 0
+
+    queues_array = np.empty((2, 4, total_points), dtype=np.int64)
+    tables_array = np.empty((total_points, 5))
+    starts_array = np.empty(total_points, dtype=np.int64)
+    ends_array = np.empty(total_points, dtype=np.int64)
+
+    cdef int64_t[:, :, ::1] queues = queues_array
+    cdef double[:, ::1] tables = tables_array
+    cdef int64_t[::1] starts = starts_array
+    cdef int64_t[::1] ends = ends_array
+
+    _haversine_tables(lats, lons, tables)
+
+    with nogil:
+        while next_check < total_points:
+            i = next_check
+
+            # Skip ahead to the first point at least check_stride_ms later
+            next_check = _search_left(ts, ts[i] + check_stride_ms, i + 1, total_points)
+
+            if not in_pause:
+                # Three criteria to start pause, cheapest first:
+                # 1. Average pace is slower than threshold (or not enough data)
+                pace_start = i - nb_points_pace if i >= nb_points_pace else 0
+                total_distance = cum_dist[i] - cum_dist[pace_start]
+                total_time = (ts[i] - ts[pace_start]) / 1000.0
+                if total_distance != 0 and total_time != 0:
+                    if not (total_time / total_distance) * 1000 / 60 > pace_threshold:
+                        continue
+
+                # 2. Point density is below threshold (or not enough data)
+                while density_start < i and ts[density_start] < ts[i] - density_window_ms:
+                    density_start += 1
+                actual_time = (ts[i] - ts[density_start]) / 1000.0
+                if actual_time != 0:
+                    if not (i - density_start + 1) / actual_time < density_threshold:
+                        continue
+
+                window = 0
+                threshold = threshold_start
+
+            else:
+                # Two criteria must BOTH be met to end the pause:
+                # 1. Average pace is faster than threshold (excluding no data)
+                pace_start = i - nb_points_pace_end if i >= nb_points_pace_end else 0
+                total_distance = cum_dist[i] - cum_dist[pace_start]
+                total_time = (ts[i] - ts[pace_start]) / 1000.0
+                if total_distance == 0 or total_time == 0:
+                    continue
+                if not (total_time / total_distance) * 1000 / 60 < pace_threshold_end:
+                    continue
+
+                window = 1
+                threshold = threshold_end
+
+            # Last criterion of both states: max distance over the time window.
+            # Points skipped since the last update of this window are dropped at once
+            if window_ends[window] < i:
+                window_ends[window] = i
+                for k in range(4):
+                    heads[window][k] = tails[window][k] = 0
+
+            # Push the points entering the window (a window always contains its starting point)
+            window_end = window_ends[window] if window_ends[window] > i else i + 1
+            while window_end < total_points and ts[window_end] <= ts[i] + window_ms[window]:
+                window_end += 1
+            for j in range(window_ends[window], window_end):
+                for k in range(4):
+                    values = &lats[0] if k < 2 else &lons[0]
+                    # Even rows keep the minimum, odd rows the maximum
+                    sign = 1.0 if k % 2 == 0 else -1.0
+                    while (tails[window][k] > heads[window][k]
+                           and sign * values[queues[window, k, tails[window][k] - 1]] >= sign * values[j]):
+                        tails[window][k] -= 1
+                    queues[window, k, tails[window][k]] = j
+                    tails[window][k] += 1
+            window_ends[window] = window_end
+
+            # Drop points that are before the start of the window
+            for k in range(4):
+                while queues[window, k, heads[window][k]] < i:
+                    heads[window][k] += 1
+
+            # Bound the max distance with the bounding box of the window (equirectangular,
+            # exact enough at window scale): the longest side and the diagonal
+            lat_min = lats[queues[window, 0, heads[window][0]]]
+            lat_max = lats[queues[window, 1, heads[window][1]]]
+            lon_min = lons[queues[window, 2, heads[window][2]]]
+            lon_max = lons[queues[window, 3, heads[window][3]]]
+            height = (lat_max - lat_min) * EARTH_RADIUS
+            width = (lon_max - lon_min) * EARTH_RADIUS * cos((lat_min + lat_max) / 2)
+            lower = height if height > width else width
+            upper = sqrt(height * height + width * width)
+
+            # The box of a window across the antimeridian spans the whole globe: no bounds then
+            bounded = lon_max - lon_min <= M_PI
+
+            # The exact pairwise distance is only needed when the bounds are too
+            # close to the threshold, and only up to the first pair above it
+            if bounded and upper < threshold * (1 - BOUND_TOLERANCE):
+                max_distance = upper
+            elif bounded and lower > threshold * (1 + BOUND_TOLERANCE):
+                max_distance = lower
+            else:
+                max_distance = 0.0
+                p = i
+                while p < window_end and max_distance <= threshold:
+                    for q in range(p + 1, window_end):
+                        sin_half_dlat = tables[q, 0] * tables[p, 1] - tables[q, 1] * tables[p, 0]
+                        sin_half_dlon = tables[q, 2] * tables[p, 3] - tables[q, 3] * tables[p, 2]
+                        h = sin_half_dlat * sin_half_dlat + tables[p, 4] * tables[q, 4] * sin_half_dlon * sin_half_dlon
+                        if h > 1.0:
+                            h = 1.0
+                        distance = 2 * EARTH_RADIUS * asin(sqrt(h))
+                        if distance > max_distance:
+                            max_distance = distance
+                            if distance > threshold:
+                                break
+                    p += 1
+
+            if not in_pause:
+                if max_distance < threshold_start:
+                    in_pause = True
+                    starts[nb_pauses] = i
+                    ends[nb_pauses] = -1
+
+            elif max_distance > threshold_end:
+                in_pause = False
+                ends[nb_pauses] = i
+                nb_pauses += 1
+
+    # Keep the pause the track ends in
+    if in_pause:
+        nb_pauses += 1
+
+    return starts_array[:nb_pauses], ends_array[:nb_pauses]
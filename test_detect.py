@@ -0,0 +1,185 @@
+"""
+Regression checks for BreakDetection.py, and a check that the Cython kernel
+of _detect.pyx finds the same pauses as the Numba/Python kernel (skipped
+when _detect is not built).
+
+Run with:
+    python -m unittest test_detect
+"""
+import dataclasses
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from BreakDetection import (_detect_pauses_core, _detect_pauses_core_compiled, _iter_trackpoints,
+                            calculate_segment_distances, detect_pauses, etree, extract_gpx_points,
+                            haversine_np, load_gpx_track)
+
+# Kernels available in this build, all of which must find the same pauses
+KERNELS = [kernel for kernel in (_detect_pauses_core, _detect_pauses_core_compiled) if kernel]
+
+# Default detection parameters, as passed to the kernels by detect_pauses
+PARAMETERS = (30, 30, 45000, 30000, 15, 10, 1.0, 30000, 20, 7, 0)
+
+
+def write_gpx(directory, times, lats=None, lons=None):
+    """
+    Write a GPX file with one trackpoint per time text, and return its path.
+    """
+    lats = np.full(len(times), 45.0) if lats is None else lats
+    lons = np.full(len(times), 5.0) if lons is None else lons
+    trkpts = ''.join(f'<trkpt lat="{lat}" lon="{lon}"><time>{time}</time></trkpt>'
+                     for lat, lon, time in zip(lats, lons, times))
+
+    path = os.path.join(directory, 'track.gpx')
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0"?><gpx xmlns="http://www.topografix.com/GPX/1/1">'
+                f'<trk><trkseg>{trkpts}</trkseg></trk></gpx>')
+    return path
+
+
+def generate_track(rng, nb_points):
+    """
+    Generate a track alternating running and stopped phases, with GPS noise,
+    irregular sampling and a few repeated timestamps.
+    Returns (lats_rad, lons_rad, ts, cum_dist).
+    """
+    ts = np.cumsum(rng.choice([300, 1000, 3000]) * rng.uniform(0.5, 1.5, nb_points)).astype(np.int64)
+    ts[nb_points // 2:nb_points // 2 + 3] = ts[nb_points // 2]
+
+    # Steps of a few meters while running, none while stopped
+    running = (np.arange(nb_points) // rng.integers(20, 80)) % 2 == 0
+    steps = rng.uniform(0, 8, nb_points) * running
+    headings = rng.uniform(0, 2 * np.pi, nb_points)
+    lats = 45 + (np.cumsum(steps * np.cos(headings)) + rng.normal(0, 2, nb_points)) / 111000
+    lons = 5 + (np.cumsum(steps * np.sin(headings)) + rng.normal(0, 2, nb_points)) / 78000
+
+    lats_rad = np.radians(lats)
+    lons_rad = np.radians(lons)
+    _, cum_dist = calculate_segment_distances(lats_rad, lons_rad)
+    return lats_rad, lons_rad, ts, cum_dist
+
+
+def generate_stop_track(stop_lon, nb_points=200, stop=(104, 142)):
+    """
+    Generate a track running east along lat 10 at about 5 m/s, one point
+    every 2 seconds, stopped at stop_lon between the stop indices.
+    Returns (lats_rad, lons_rad, ts, cum_dist).
+    """
+    rng = np.random.default_rng(1)
+    ts = np.arange(nb_points, dtype=np.int64) * 2000
+
+    steps = np.full(nb_points, 1e-4)
+    steps[stop[0]:stop[1]] = 0
+    lons = stop_lon + np.cumsum(steps) - np.cumsum(steps)[stop[0]] + rng.normal(0, 2e-5, nb_points)
+    lats = 10 + rng.normal(0, 1e-6, nb_points)
+
+    # Longitudes as written in a GPX file, in [-180, 180)
+    lats_rad = np.radians(lats)
+    lons_rad = np.radians((lons + 180) % 360 - 180)
+    _, cum_dist = calculate_segment_distances(lats_rad, lons_rad)
+    return lats_rad, lons_rad, ts, cum_dist
+
+
+class TestAntimeridian(unittest.TestCase):
+
+    def test_segment_distances(self):
+        lats_rad = np.radians([10.0, 10.0, 10.0])
+        lons_rad = np.radians([179.9999, -179.9999, 179.9998])
+        seg_dist, _ = calculate_segment_distances(lats_rad, lons_rad)
+
+        expected = haversine_np(lats_rad[:-1], lons_rad[:-1], lats_rad[1:], lons_rad[1:])
+        np.testing.assert_allclose(seg_dist, expected, rtol=1e-6)
+
+    def test_pause_at_antimeridian(self):
+        for kernel in KERNELS:
+            starts, ends = kernel(*generate_stop_track(180.0), *PARAMETERS)
+            shifted_starts, shifted_ends = kernel(*generate_stop_track(170.0), *PARAMETERS)
+
+            self.assertEqual(len(starts), 1)
+            np.testing.assert_array_equal(starts, shifted_starts)
+            np.testing.assert_array_equal(ends, shifted_ends)
+
+
+class TestGpxParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_unparsable_utc_times_are_skipped(self):
+        times = ['2024-01-15T10:00:00Z', 'Z', 'NaTZ', '2024-01-15T10:00:01Z']
+        lats, lons, ts, _ = extract_gpx_points(write_gpx(self.directory.name, times))
+
+        self.assertEqual(len(lats), 2)
+        np.testing.assert_array_equal(ts, [1705312800000, 1705312801000])
+
+    def test_pause_boundaries_keep_their_utc_offset(self):
+        # A single stop long enough to be a pause until the end of the track
+        for offset in ('+02:00', '-05:30', 'Z', ''):
+            times = [f'2024-01-15T10:00:{2 * second:02d}{offset}' for second in range(10)]
+            pauses, _ = detect_pauses(write_gpx(self.directory.name, times), verbose=False)
+
+            self.assertEqual(len(pauses), 1)
+            self.assertEqual(pauses[0]['start'].isoformat(), times[0].replace('Z', '+00:00'))
+            self.assertEqual(pauses[0]['end'].isoformat(), times[-1].replace('Z', '+00:00'))
+
+    @unittest.skipIf(etree is None, "lxml is not installed")
+    def test_streamed_trackpoints_are_detached(self):
+        times = [f'2024-01-15T10:00:{second:02d}Z' for second in range(10)]
+
+        for trkpt in _iter_trackpoints(write_gpx(self.directory.name, times)):
+            # Only the trackpoint read just before is still in the segment
+            self.assertLessEqual(len(list(trkpt.itersiblings(preceding=True))), 1)
+        self.assertEqual(len(trkpt.getparent()), 1)
+
+
+class TestTrackCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_cached_track_is_read_only(self):
+        times = ['2024-01-15T10:00:00Z', '2024-01-15T10:00:01Z']
+        path = write_gpx(self.directory.name, times)
+        track = load_gpx_track(path)
+
+        self.assertIs(load_gpx_track(path), track)
+        with self.assertRaises(ValueError):
+            track.cum_dist[0] = 1.0
+
+    def test_tracks_compare_by_identity(self):
+        times = ['2024-01-15T10:00:00Z', '2024-01-15T10:00:01Z']
+        track = load_gpx_track(write_gpx(self.directory.name, times))
+        copy = dataclasses.replace(track)
+
+        self.assertNotEqual(copy, track)
+        self.assertEqual(len({copy, track}), 2)
+
+
+@unittest.skipIf(_detect_pauses_core_compiled is None, "the Cython kernel is not built")
+class TestKernelParity(unittest.TestCase):
+
+    def test_same_pauses(self):
+        rng = np.random.default_rng(0)
+
+        for _ in range(50):
+            track = generate_track(rng, int(rng.integers(2, 600)))
+            parameters = (rng.uniform(5, 40), rng.uniform(5, 40),
+                          int(rng.integers(1000, 60000)), int(rng.integers(1000, 60000)),
+                          rng.uniform(3, 30), int(rng.integers(0, 15)), rng.uniform(0.1, 3),
+                          int(rng.integers(1000, 40000)), rng.uniform(3, 30), int(rng.integers(0, 12)))
+
+            for check_stride_ms in (0, 1000):
+                starts, ends = _detect_pauses_core(*track, *parameters, check_stride_ms)
+                compiled_starts, compiled_ends = _detect_pauses_core_compiled(*track, *parameters,
+                                                                              check_stride_ms)
+                np.testing.assert_array_equal(starts, compiled_starts)
+                np.testing.assert_array_equal(ends, compiled_ends)
+
+
+if __name__ == '__main__':
+    unittest.main()